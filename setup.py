@@ -10,13 +10,20 @@ except Exception:
 
 requirements = [
     "discord.py>=1.5.0",
-    "toml",
+    'rtoml; python_version < "3.11"',
     "asyncpg",
     "aioredis",
     "aiodogstatsd",
 ]
 
 
+extras = {
+    "speed": [
+        "orjson",
+    ],
+}
+
+
 __version__ = "0.0.8"
 
 
@@ -37,4 +44,5 @@ setuptools.setup(
     ],
     python_requires='>=3.6',
     install_requires=requirements,
+    extras_require=extras,
 )
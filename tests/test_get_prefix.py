@@ -0,0 +1,42 @@
+import types
+
+import pytest
+
+pytest.importorskip("discord")
+
+from voxelbotutils.cogs.utils.custom_bot import get_prefix, get_prefix_matcher  # noqa: E402
+
+
+MENTIONS = ["<@1> ", "<@!1> "]
+
+
+def make_bot(prefix):
+    return types.SimpleNamespace(config={'default_prefix': prefix}, _mention_prefixes=MENTIONS)
+
+
+def make_message(content):
+    return types.SimpleNamespace(guild=None, content=content)
+
+
+@pytest.mark.parametrize("prefix", [[], "", [""], ["", ""]])
+def test_empty_prefixes_only_use_mentions(prefix):
+    assert get_prefix(make_bot(prefix), make_message("hello")) == MENTIONS
+
+
+def test_empty_matcher():
+    assert get_prefix_matcher(()) is None
+    assert get_prefix_matcher(("",)) is None
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("vox help", "vox "),
+    ("vOx help", "vOx "),
+    ("VOXhelp", "VOX"),
+])
+def test_case_insensitive_word_prefix(content, expected):
+    assert get_prefix(make_bot("vox"), make_message(content)) == [*MENTIONS, expected]
+
+
+def test_punctuation_prefix_gets_no_space_variant():
+    assert get_prefix(make_bot("!"), make_message("! help")) == [*MENTIONS, "!"]
+    assert get_prefix(make_bot("!"), make_message("help")) == [*MENTIONS, "!"]
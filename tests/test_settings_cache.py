@@ -0,0 +1,80 @@
+import copy
+import importlib.util
+import pathlib
+
+import pytest
+
+
+# Load the module directly so that the tests don't need discord.py installed
+_path = pathlib.Path(__file__).parent.parent / "voxelbotutils" / "cogs" / "utils" / "settings_cache.py"
+_spec = importlib.util.spec_from_file_location("settings_cache", _path)
+settings_cache = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(settings_cache)
+
+
+@pytest.fixture
+def cache():
+    defaults = {'guild_id': 0, 'prefix': None, 'roles': []}
+    cache = settings_cache.SettingsCache(lambda: defaults)
+    cache.load([
+        {'guild_id': 1, 'prefix': '!', 'roles': [10]},
+        {'guild_id': 2, 'prefix': '?', 'roles': []},
+    ], 'guild_id')
+    return cache
+
+
+def test_unknown_id_gives_defaults(cache):
+    assert cache[3].copy() == {'guild_id': 0, 'prefix': None, 'roles': []}
+    assert cache.get(3) is None
+    assert 3 not in cache
+
+
+def test_mutable_default_read_does_not_store(cache):
+    cache[3]['roles'].append(5)
+    assert cache[3]['roles'] == [5]
+    assert cache.defaults['roles'] == []
+    assert 3 not in cache
+    assert len(cache) == 2
+
+
+def test_setitem_replaces_row(cache):
+    cache[1] = {'prefix': 'y'}
+    assert cache[1].copy() == {'guild_id': 0, 'prefix': 'y', 'roles': []}
+
+
+def test_pop_returns_snapshot(cache):
+    cache[5] = {'prefix': 'y'}
+    popped = cache.pop(5)
+    assert isinstance(popped, dict)
+    assert popped['prefix'] == 'y'
+    assert 5 not in cache
+
+
+def test_pop_missing(cache):
+    assert cache.pop(99, None) is None
+    with pytest.raises(KeyError):
+        cache.pop(99)
+
+
+def test_popitem(cache):
+    item_id, settings = cache.popitem()
+    assert item_id == 1
+    assert settings['prefix'] == '!'
+    cache.popitem()
+    with pytest.raises(KeyError):
+        cache.popitem()
+
+
+def test_setdefault(cache):
+    assert cache.setdefault(1, {'prefix': 'z'})['prefix'] == '!'
+    assert cache.setdefault(7, {'prefix': 'z'})['prefix'] == 'z'
+    assert 7 in cache
+
+
+def test_copies_are_plain_dicts(cache):
+    view = cache[1]
+    assert copy.copy(view) == {'guild_id': 1, 'prefix': '!', 'roles': [10]}
+    deep = copy.deepcopy(view)
+    assert isinstance(deep, dict)
+    deep['roles'].append(11)
+    assert cache[1]['roles'] == [10]
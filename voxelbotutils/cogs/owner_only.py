@@ -142,6 +142,7 @@ class OwnerOnly(utils.Cog, command_attrs={'hidden': True}):
         # Get a list of cogs to reload
         cog_name = 'cogs.' + '_'.join([i for i in cog_name])
         if cog_name == 'cogs.*':
+            self.bot.invalidate_extension_cache()
             cog_list = [i for i in self.bot.get_extensions() if i.startswith('cogs.')]
         else:
             cog_list = [cog_name]
@@ -59,6 +59,7 @@ class AnalyticsLogHandler(logging.NullHandler):
             re.compile(r'/guilds/([0-9]{15,23})/roles', re.IGNORECASE): 'move_role_position',
         },
     }
+    HTTP_LOG_FORMAT = '%s %s with %s has returned %s'
     MESSAGE_DECONSTRUCTOR = re.compile(r"^(?P<method>.+) https://discord(:?app)?.(?:com|gg)/api/v\d(?P<endpoint>.+) with (?P<payload>.+) has returned (?P<status>\d+)$")
 
     def __init__(self, bot, *args, **kwargs):
@@ -74,20 +75,36 @@ class AnalyticsLogHandler(logging.NullHandler):
         return None
 
     def handle(self, record:logging.LogRecord):
-        message = record.getMessage()
-        self.bot.loop.create_task(self.log_response(message))
+
+        # Don't bother doing anything if we're not going to send it anywhere
+        if not self.bot.stats.is_enabled():
+            return super().handle(record)
+
+        # D.py's request log has the method, URL, payload, and status as its args, so we can grab what
+        # we want from there without having to format the (potentially large) payload into the message
+        if record.msg == self.HTTP_LOG_FORMAT and len(record.args) == 4:
+            method, url, _, status = record.args
+            self.log_request(method, str(url), str(status))
+        else:
+            match = self.MESSAGE_DECONSTRUCTOR.search(record.getMessage())
+            if match is not None:
+                self.log_request(match.group("method"), match.group("endpoint"), match.group("status"))
         return super().handle(record)
 
-    async def log_response(self, message):
-        match = self.MESSAGE_DECONSTRUCTOR.search(message)
-        if match is None:
-            return
-        event_name = self.get_event_name(match.group("method"), match.group("endpoint"))
+    def log_request(self, method:str, endpoint:str, status:str) -> None:
+        event_name = self.get_event_name(method, endpoint)
         if event_name is None:
             return
+        tags = {
+            "endpoint": event_name,
+            "status_code": int(status),
+            "status_code_class": status[0] + "x" * (len(status) - 1)
+        }
+        if self.bot._stats_client is not None:
+            self.bot._stats_client.increment("discord.http", tags=tags)
+        else:
+            self.bot.loop.create_task(self._increment_with_connection(tags))
+
+    async def _increment_with_connection(self, tags:dict) -> None:
         async with self.bot.stats() as stats:
-            stats.increment("discord.http", tags={
-                "endpoint": event_name,
-                "status_code": int(match.group("status")),
-                "status_code_class": match.group("status")[0] + "x" * (len(match.group("status")) - 1)
-            })
+            stats.increment("discord.http", tags=tags)
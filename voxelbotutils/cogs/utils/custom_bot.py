@@ -1,26 +1,67 @@
 import asyncio
-import collections
+import functools
 import glob
+import json
 import logging
+import re
 import typing
-import copy
 from datetime import datetime as dt
 from urllib.parse import urlencode
 import string
 
 import aiohttp
 import discord
-import toml
 from discord.ext import commands
+try:
+    import tomllib
+except ImportError:
+    import rtoml as tomllib
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from .custom_context import CustomContext
 from .database import DatabaseConnection
 from .redis import RedisConnection
+from .settings_cache import SettingsCache
 from .statsd import StatsdConnection
 from .analytics_log_handler import AnalyticsLogHandler
 from .. import all_packages as all_vfl_package_names
 
 
+def json_dumps(obj) -> bytes:
+    """Serialises an object to JSON, using orjson if it's installed"""
+
+    if orjson is None:
+        return json.dumps(obj).encode()
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+PUNCTUATION = frozenset(string.punctuation)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_prefix_matcher(prefix:typing.Tuple[str]) -> typing.Optional[typing.Pattern]:
+    """
+    Compiles the given prefixes (with spaces added for words) into one case insensitive pattern,
+    longest first. This is cached with a fixed size since guilds can set whatever prefix they like.
+    Returns None if there are no non-empty prefixes, since an empty pattern would match everything.
+    """
+
+    prefixes = []
+    for i in prefix:
+        if not i:
+            continue
+        prefixes.append(i)
+        if PUNCTUATION.isdisjoint(i):
+            prefixes.append(f"{i.strip()} ")
+    if not prefixes:
+        return None
+    prefixes.sort(key=len, reverse=True)
+    return re.compile("|".join([re.escape(i) for i in prefixes]), re.IGNORECASE)
+
+
 def get_prefix(bot, message:discord.Message):
     """Gives the prefix for the bot - override this to make guild-specific prefixes"""
 
@@ -36,39 +77,54 @@ def get_prefix(bot, message:discord.Message):
     if type(prefix) is not list and prefix in ["'", "‘"]:
         prefix = ["'", "‘"]
 
-    # Listify it
+    # Listify it, ignoring empty prefixes so that we don't match every message
     prefix = [prefix] if isinstance(prefix, str) else prefix
+    prefix = [i for i in prefix if i]
 
-    # Make it slightly more case insensitive
-    prefix.extend([i.title() for i in prefix])
+    # Get the (cached) matcher for this prefix - mention-only bots don't need any matching
+    mentions = bot._mention_prefixes or commands.when_mentioned(bot, message)
+    matcher = get_prefix_matcher(tuple(prefix))
+    if matcher is None:
+        return list(mentions)
 
-    # Add spaces for words
-    possible_word_prefixes = [i for i in prefix if not any([o in i for o in string.punctuation])]
-    prefix.extend([f"{i.strip()} " for i in possible_word_prefixes])
+    # Work out which (if any) of the prefixes were used - we return the prefix as it appears in the
+    # message so that D.py's (case sensitive) matching still works
+    match = matcher.match(message.content)
+    if match is not None:
+        return [*mentions, match.group()]
 
     # And we're FINALLY done
-    return commands.when_mentioned_or(*prefix)(bot, message)
+    return [*mentions, *prefix]
 
 
 class CustomBot(commands.AutoShardedBot):
     """
     A child of discord.ext.commands.AutoShardedBot to make things a little easier when
     doing my own stuff.
+
+    Attributes:
+        guild_settings (SettingsCache): The cached rows from the guild_settings table, keyed by guild ID.
+        user_settings (SettingsCache): The cached rows from the user_settings table, keyed by user ID.
+
+    Note:
+        `guild_settings` and `user_settings` are not dicts - indexing them gives a dict-like `SettingsView`,
+        so `isinstance(view, dict)` is False and `json.dumps(view)` fails; use `view.copy()` to get a
+        plain dict of the settings.
     """
 
     def __init__(
-            self, config_file:str='config/config.toml', logger:logging.Logger=None, activity:discord.Activity=discord.Game(name="Reconnecting..."),
+            self, config_file:str='config/config.toml', logger:logging.Logger=None, activity:discord.Activity=None,
             status:discord.Status=discord.Status.dnd, case_insensitive:bool=True, intents:discord.Intents=None,
-            allowed_mentions:discord.AllowedMentions=discord.AllowedMentions(everyone=False), *args, **kwargs):
+            allowed_mentions:discord.AllowedMentions=None, *args, **kwargs):
         """
         Args:
             config_file (str, optional): The path to the config file for the bot.
             logger (logging.Logger, optional): The logger object that the bot should use.
-            activity (discord.Activity, optional): The default activity of the bot.
+            activity (discord.Activity, optional): The default activity of the bot - defaults to playing "Reconnecting...".
             status (discord.Status, optional): The default status of the bot.
             case_insensitive (bool, optional): Whether or not commands are case insensitive.
             intents (discord.Intents, optional): The default intents for the bot.
-            allowed_mentions (discord.AllowedMentions, optional): The default allowed mentions for the bot.
+            allowed_mentions (discord.AllowedMentions, optional): The default allowed mentions for the bot - defaults to not pinging everyone.
             *args: The default args that are sent to the `discord.ext.commands.Bot` object.
             **kwargs: The default args that are sent to the `discord.ext.commands.Bot` object.
         """
@@ -85,6 +141,12 @@ class CustomBot(commands.AutoShardedBot):
         else:
             intents = discord.Intents(guilds=True, guild_messages=True, dm_messages=True)
 
+        # Fill in our defaults
+        if activity is None:
+            activity = discord.Game(name="Reconnecting...")
+        if allowed_mentions is None:
+            allowed_mentions = discord.AllowedMentions(everyone=False)
+
         # Run original
         super().__init__(
             command_prefix=get_prefix, activity=activity, status=status, case_insensitive=case_insensitive, intents=intents,
@@ -113,19 +175,25 @@ class CustomBot(commands.AutoShardedBot):
         self.stats = StatsdConnection
         self.stats.config = self.config.get('statsd', {})
         self.stats.logger = self.logger.getChild('statsd')
+        self._stats_client = None  # A long-lived connection for hot paths, opened in `start`
 
         # Store the startup method so I can see if it completed successfully
         self.startup_time = dt.now()
         self.startup_method = None
+        self.warm_pools_task = None
+
+        # Filled by self.get_extensions()
+        self._extensions_cache = None
 
         # Regardless of whether we start statsd or not, I want to add the log handler
         handler = AnalyticsLogHandler(self)
-        handler.setLevel(logging.DEBUG)
+        handler.setLevel(logging.DEBUG)  # D.py logs its requests at debug level
         logging.getLogger('discord.http').addHandler(handler)
 
         # Here's the storage for cached stuff
-        self.guild_settings = collections.defaultdict(lambda: copy.deepcopy(self.DEFAULT_GUILD_SETTINGS))
-        self.user_settings = collections.defaultdict(lambda: copy.deepcopy(self.DEFAULT_USER_SETTINGS))
+        self._mention_prefixes = None  # Filled in on_ready
+        self.guild_settings = SettingsCache(lambda: self.DEFAULT_GUILD_SETTINGS)
+        self.user_settings = SettingsCache(lambda: self.DEFAULT_USER_SETTINGS)
 
     async def startup(self):
         """
@@ -140,7 +208,8 @@ class CustomBot(commands.AutoShardedBot):
 
     async def _startup(self):
         """
-        Runs the actual db stuff so I can wrap it in a try
+        Runs the actual db stuff so I can wrap it in a try. Cogs' `cache_setup` methods are run
+        concurrently after the settings caches are filled, so they don't run in cog load order.
         """
 
         # Remove caches
@@ -148,48 +217,45 @@ class CustomBot(commands.AutoShardedBot):
         self.guild_settings.clear()
         self.user_settings.clear()
 
-        # Get database connection
-        db = await self.database.get_connection()
+        # Get the settings tables - these don't depend on each other so we can grab them at once
+        (default_guild_settings, guild_data), (default_user_settings, user_data) = await asyncio.gather(
+            self._get_settings_table_data("guild_settings", "guild_id"),
+            self._get_settings_table_data("user_settings", "user_id"),
+        )
 
         # Get default guild settings
-        default_guild_settings = await db("SELECT * FROM guild_settings WHERE guild_id=0")
-        if not default_guild_settings:
-            default_guild_settings = await db("INSERT INTO guild_settings (guild_id) VALUES (0) RETURNING *")
-        for i, o in default_guild_settings[0].items():
+        for i, o in default_guild_settings.items():
             self.DEFAULT_GUILD_SETTINGS.setdefault(i, o)
 
         # Get guild settings
-        data = await self._get_all_table_data(db, "guild_settings")
-        for row in data:
-            for key, value in row.items():
-                self.guild_settings[row['guild_id']][key] = value
+        self.guild_settings.load(guild_data, 'guild_id')
 
         # Get default user settings
-        default_user_settings = await db("SELECT * FROM user_settings WHERE user_id=0")
-        if not default_user_settings:
-            default_user_settings = await db("INSERT INTO user_settings (user_id) VALUES (0) RETURNING *")
-        for i, o in default_user_settings[0].items():
+        for i, o in default_user_settings.items():
             self.DEFAULT_USER_SETTINGS.setdefault(i, o)
 
         # Get user settings
-        data = await self._get_all_table_data(db, "user_settings")
-        for row in data:
-            for key, value in row.items():
-                self.user_settings[row['user_id']][key] = value
-
-        # Run the user-added startup methods
-        async def fake_cache_setup_method(db):
-            pass
-        for cog_name, cog in self.cogs.items():
-            await getattr(cog, "cache_setup", fake_cache_setup_method)(db)
+        self.user_settings.load(user_data, 'user_id')
+
+        # Run the user-added startup methods - these can write into the settings caches so they
+        # run after those are populated, but they're run concurrently so they aren't in cog load order
+        from .custom_cog import CustomCog  # Circular import
+        cache_setup_methods = [
+            cog.cache_setup for cog in self.cogs.values()
+            if getattr(type(cog), "cache_setup", CustomCog.cache_setup) is not CustomCog.cache_setup
+        ]
+        semaphore = asyncio.Semaphore(max(self.config['database'].get('pool_size', 10) - 1, 1))
+
+        async def run_cache_setup(method):
+            async with semaphore:
+                async with self.database() as db:
+                    await method(db)
+        await asyncio.gather(*[run_cache_setup(i) for i in cache_setup_methods])
 
         # Wait for the bot to cache users before continuing
         self.logger.debug("Waiting until ready before completing startup method.")
         await self.wait_until_ready()
 
-        # Close database connection
-        await db.disconnect()
-
     async def _run_sql_exit_on_error(self, db, sql, *args):
         """Get data form a table, exiting if it can't"""
 
@@ -204,6 +270,20 @@ class CustomBot(commands.AutoShardedBot):
 
         return await self._run_sql_exit_on_error(db, "SELECT * FROM {0}".format(table_name))
 
+    async def _get_settings_table_data(self, table_name, key_column):
+        """
+        Get all data from a settings table using its own connection from the pool, as well as the
+        default row (with an ID of 0) - creating it if it doesn't exist
+        """
+
+        async with self.database() as db:
+            data = list(await self._get_all_table_data(db, table_name))
+            default = next((row for row in data if row[key_column] == 0), None)
+            if default is None:
+                default = (await db("INSERT INTO {0} ({1}) VALUES (0) RETURNING *".format(table_name, key_column)))[0]
+                data.append(default)
+        return default, data
+
     async def _get_list_table_data(self, db, table_name, key):
         """Get all data from a table"""
 
@@ -231,16 +311,21 @@ class CustomBot(commands.AutoShardedBot):
             str: The URL for the invite.
         """
 
-        # Make the permissions object
-        permissions = discord.Permissions()
+        # Work out the permissions value from the flags directly
+        permissions = 0
         for name, value in kwargs.items():
-            setattr(permissions, name, value)
+            try:
+                flag = discord.Permissions.VALID_FLAGS[name]
+            except KeyError:
+                raise TypeError(f"{name!r} is not a valid permission name.")
+            if value:
+                permissions |= flag
 
         # Make the params for the url
         data = {
             'client_id': self.config.get('oauth', {}).get('client_id', None) or self.user.id,
             'scope': scope,
-            'permissions': permissions.value
+            'permissions': permissions,
         }
         if redirect_uri:
             data['redirect_uri'] = redirect_uri
@@ -254,9 +339,11 @@ class CustomBot(commands.AutoShardedBot):
 
     @property
     def event_webhook(self):
-        if self.config['event_webhook_url'] in [None, 0, ""]:
-            return None
-        return discord.Webhook(self.config['event_webhook_url'], adapter=discord.AsyncWebhookAdapter(self.session))
+        if self._event_webhook is None:
+            if self.config['event_webhook_url'] in [None, 0, ""]:
+                return None
+            self._event_webhook = discord.Webhook.from_url(self.config['event_webhook_url'], adapter=discord.AsyncWebhookAdapter(self.session))
+        return self._event_webhook
 
     async def add_delete_button(self, message:discord.Message, valid_users:typing.List[discord.User], *, delete:typing.List[discord.Message]=None, timeout=60.0, wait:bool=True) -> None:
         """
@@ -284,9 +371,16 @@ class CustomBot(commands.AutoShardedBot):
         except discord.HTTPException as e:
             raise e  # Maybe return none here - I'm not sure yet.
 
+        # See what we're allowed to do here
+        manage_messages, read_message_history = False, False
+        if message.guild:
+            permissions: discord.Permissions = message.channel.permissions_for(message.guild.me)
+            manage_messages, read_message_history = permissions.manage_messages, permissions.read_message_history
+
         # Fix up arguments
         if not isinstance(valid_users, list):
             valid_users = [valid_users]
+        valid_user_ids = frozenset(user.id for user in valid_users)
 
         # Wait for response
         def check(r, u) -> bool:
@@ -300,13 +394,15 @@ class CustomBot(commands.AutoShardedBot):
                 return False
             if str(r.emoji) != "\N{WASTEBASKET}":
                 return False
-            if u.id in [user.id for user in valid_users] or u.permissions_in(message.channel).manage_messages:
+            if u.id in valid_user_ids or u.permissions_in(message.channel).manage_messages:
                 return True
             return False
         try:
             await self.wait_for("reaction_add", check=check, timeout=timeout)
         except asyncio.TimeoutError:
             try:
+                if manage_messages:
+                    return await message.clear_reaction("\N{WASTEBASKET}")  # Gets rid of everyone's reactions while we're at it
                 return await message.remove_reaction("\N{WASTEBASKET}", self.user)
             except Exception:
                 return
@@ -314,14 +410,12 @@ class CustomBot(commands.AutoShardedBot):
         # We got a response
         if delete is None:
             delete = [message]
+        delete_ids = frozenset(i.id for i in delete)
 
         # Try and bulk delete
-        bulk = False
-        if message.guild:
-            permissions: discord.Permissions = message.channel.permissions_for(message.guild.me)
-            bulk = permissions.manage_messages and permissions.read_message_history
+        bulk = manage_messages and read_message_history
         try:
-            await message.channel.purge(check=lambda m: m.id in [i.id for i in delete], bulk=bulk)
+            await message.channel.purge(check=lambda m: m.id in delete_ids, bulk=bulk)
         except Exception:
             return  # Ah well
 
@@ -347,38 +441,37 @@ class CustomBot(commands.AutoShardedBot):
         }
         data_authors = {}
         data_messages = []
+        _str = str
 
-        # Get the data from the server
-        for message in messages:
+        # Get the data from the server - the API wants the messages oldest first
+        for message in reversed(messages):
             for user in message.mentions + [message.author]:
+                if user.id in data_authors:
+                    continue
                 data_authors[user.id] = {
                     "username": user.name,
                     "discriminator": user.discriminator,
-                    "avatar_url": str(user.avatar_url),
+                    "avatar_url": _str(user.avatar_url),
                     "bot": user.bot,
                     "display_name": user.display_name,
                     "color": user.colour.value,
                 }
-            message_data = {
+            data_messages.append({
                 "id": message.id,
                 "content": message.content,
                 "author_id": message.author.id,
                 "timestamp": int(message.created_at.timestamp()),
-                "attachments": [str(i.url) for i in message.attachments],
-                # "embeds": [i.to_dict() for i in message.embeds],
-            }
-            embeds = []
-            for i in message.embeds:
-                embed_data = i.to_dict()
-                if i.timestamp:
-                    embed_data.update({'timestamp': i.timestamp.timestamp()})
-                embeds.append(embed_data)
-            message_data.update({'embeds': embeds})
-            data_messages.append(message_data)
+                "attachments": [_str(i.url) for i in message.attachments],
+                "embeds": [
+                    {**i.to_dict(), 'timestamp': i.timestamp.timestamp()} if i.timestamp else i.to_dict()
+                    for i in message.embeds
+                ],
+            })
 
         # Send data to the API
-        data.update({"users": data_authors, "messages": data_messages[::-1]})
-        async with self.session.post("https://voxelfox.co.uk/discord/chatlog", json=data) as r:
+        data.update({"users": data_authors, "messages": data_messages})
+        headers = {"Content-Type": "application/json"}
+        async with self.session.post("https://voxelfox.co.uk/discord/chatlog", data=json_dumps(data), headers=headers) as r:
             return await r.text()
 
     @property
@@ -420,20 +513,34 @@ class CustomBot(commands.AutoShardedBot):
             typing.List[str]: A list of the extensions found in the cogs/ folder, as well as the cogs included with the library.
         """
 
-        ext = glob.glob('cogs/[!_]*.py')
-        extensions = [i.replace('\\', '.').replace('/', '.')[:-3] for i in ext]
-        extensions.extend([f'voxelbotutils.cogs.{i}' for i in all_vfl_package_names])
-        self.logger.debug("Getting all extensions: " + str(extensions))
-        return extensions
+        if self._extensions_cache is None:
+            ext = glob.glob('cogs/[!_]*.py')
+            extensions = [i.replace('\\', '.').replace('/', '.')[:-3] for i in ext]
+            extensions.extend([f'voxelbotutils.cogs.{i}' for i in all_vfl_package_names])
+            self.logger.debug("Getting all extensions: " + str(extensions))
+            self._extensions_cache = extensions
+        return self._extensions_cache.copy()
+
+    def invalidate_extension_cache(self) -> None:
+        """
+        Clears the cached list of extensions so that the next call to self.get_extensions() looks
+        through the cogs/ folder again.
+        """
+
+        self._extensions_cache = None
 
     def load_all_extensions(self) -> None:
         """
         Loads all the given extensions from self.get_extensions().
         """
 
+        # Get the extensions fresh from the disk
+        self.invalidate_extension_cache()
+        extensions = self.get_extensions()
+
         # Unload all the given extensions
         self.logger.info('Unloading extensions... ')
-        for i in self.get_extensions():
+        for i in extensions:
             try:
                 self.unload_extension(i)
             except Exception as e:
@@ -443,7 +550,7 @@ class CustomBot(commands.AutoShardedBot):
 
         # Now load em up again
         self.logger.info('Loading extensions... ')
-        for i in self.get_extensions():
+        for i in extensions:
             try:
                 self.load_extension(i)
             except Exception as e:
@@ -463,6 +570,8 @@ class CustomBot(commands.AutoShardedBot):
         # Update presence
         self.logger.info("Setting default bot presence")
         presence = self.config['presence']  # Get text
+        activity_type = getattr(discord.ActivityType, presence['activity_type'].lower())
+        status = getattr(discord.Status, presence['status'].lower())
 
         # Update per shard
         if self.shard_count > 1:
@@ -473,22 +582,14 @@ class CustomBot(commands.AutoShardedBot):
             else:
                 min, max = self.shard_ids[0], self.shard_ids[-1]  # If we're setting for all shards
 
-            # Go through each shard ID
+            # Go through each shard ID - the name is the only thing that changes
             for i in range(min, max):
-                activity = discord.Activity(
-                    name=f"{presence['text']} (shard {i})",
-                    type=getattr(discord.ActivityType, presence['activity_type'].lower())
-                )
-                status = getattr(discord.Status, presence['status'].lower())
+                activity = discord.Activity(name=f"{presence['text']} (shard {i})", type=activity_type)
                 await self.change_presence(activity=activity, status=status, shard_id=i)
 
         # Not sharded - just do everywhere
         else:
-            activity = discord.Activity(
-                name=presence['text'],
-                type=getattr(discord.ActivityType, presence['activity_type'].lower())
-            )
-            status = getattr(discord.Status, presence['status'].lower())
+            activity = discord.Activity(name=presence['text'], type=activity_type)
             await self.change_presence(activity=activity, status=status)
 
     def reload_config(self) -> None:
@@ -497,13 +598,41 @@ class CustomBot(commands.AutoShardedBot):
         """
 
         self.logger.info("Reloading config")
+        self._event_webhook = None
         try:
             with open(self.config_file) as a:
-                self.config = toml.load(a)
+                self.config = tomllib.loads(a.read())
         except Exception as e:
             self.logger.critical(f"Couldn't read config file - {e}")
             exit(1)
 
+    async def warm_pools(self, pool_size:int=None) -> None:
+        """
+        Opens connections to redis so that the first commands after startup don't have to wait on
+        connection handshakes. The database pool doesn't need this as it opens `pool_warm_size`
+        connections itself when it's created.
+
+        Args:
+            pool_size (int, optional): The amount of connections to open - defaults to the
+                `pool_warm_size` value in the database config, or 5.
+        """
+
+        if not self.config['redis']['enabled']:
+            return
+        if pool_size is None:
+            pool_size = self.config['database'].get('pool_warm_size', 5)
+
+        async def warm_one_redis():
+            async with self.redis() as conn:
+                await conn.ping()
+
+        # And do it
+        self.logger.info("Warming redis connection pool")
+        results = await asyncio.gather(*[warm_one_redis() for _ in range(pool_size)], return_exceptions=True)
+        for i in results:
+            if isinstance(i, Exception):
+                self.logger.warning(f"Failed to warm connection - {i}")
+
     async def login(self, token:str=None, *args, **kwargs):
         await super().login(token or self.config['token'], *args, **kwargs)
 
@@ -513,10 +642,16 @@ class CustomBot(commands.AutoShardedBot):
             self.startup_method = self.loop.create_task(self.startup())
         else:
             self.logger.info("Not running bot startup method due to database being disabled")
+        self.warm_pools_task = self.loop.create_task(self.warm_pools())
+        self._stats_client = await self.stats.get_connection()
         self.logger.info("Running original D.py start method")
         await super().start(token or self.config['token'], *args, **kwargs)
 
     async def close(self, *args, **kwargs):
+        if self._stats_client is not None:
+            self.logger.debug("Closing Statsd connection")
+            await self._stats_client.disconnect()
+            self._stats_client = None
         self.logger.debug("Closing aiohttp ClientSession")
         await asyncio.wait_for(self.session.close(), timeout=None)
         self.logger.debug("Running original D.py logout method")
@@ -524,6 +659,7 @@ class CustomBot(commands.AutoShardedBot):
 
     async def on_ready(self):
         self.logger.info(f"Bot connected - {self.user} // {self.user.id}")
+        self._mention_prefixes = [f"<@{self.user.id}> ", f"<@!{self.user.id}> "]
         self.logger.info("Setting activity to default")
         await self.set_default_presence()
         self.logger.info('Bot loaded.')
@@ -531,13 +667,19 @@ class CustomBot(commands.AutoShardedBot):
     async def invoke(self, ctx):
         if ctx.command is None:
             return await super().invoke(ctx)
-        command_stats_name = ctx.command.qualified_name.replace(' ', ':')
+        try:
+            command_stats_name = ctx.command._stats_name
+        except AttributeError:
+            command_stats_name = ctx.command._stats_name = ctx.command.qualified_name.replace(' ', ':')
         command_stats_tags = {
             "command_name": command_stats_name,
             # "guild_id": "DMs" if ctx.guild is None else ctx.guild.id,
             # "user_id": ctx.author.id,
             # "channel_id": "DMs" if ctx.guild is None else ctx.channel.id,
         }
-        async with self.stats() as stats:
-            stats.increment("discord.bot.commands", tags=command_stats_tags)
+        if self._stats_client is not None:
+            self._stats_client.increment("discord.bot.commands", tags=command_stats_tags)
+        else:
+            async with self.stats() as stats:
+                stats.increment("discord.bot.commands", tags=command_stats_tags)
         return await super().invoke(ctx)
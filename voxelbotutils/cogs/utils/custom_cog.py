@@ -40,7 +40,8 @@ class CustomCog(OriginalCog):
     async def cache_setup(self, database:DatabaseConnection):
         """
         A method that gets run when the bot's startup method is run - intended for setting up cached information
-        in the bot object that aren't in the guild_settings or user_settings tables
+        in the bot object that aren't in the guild_settings or user_settings tables. These are run concurrently
+        with each other (after the settings tables are cached), so they shouldn't rely on the order cogs were loaded in.
         """
 
         pass
@@ -25,6 +25,8 @@ class DatabaseConnection(object):
 
         Args:
             config (dict): The configuration for the dictionary, passed directly to `asyncpg.create_pool` as kwargs.
+                A `pool_size` key can be given as a shorthand for the pool's `max_size`, and a `pool_warm_size` key
+                for the amount of connections that are opened when the pool is created (its `min_size`).
         """
 
         cls.config = config.copy()
@@ -32,6 +34,15 @@ class DatabaseConnection(object):
         if modified_config.pop('enabled') is False:
             cls.logger.critical("Database create pool method is being run when the database is disabled")
             exit(1)
+        pool_warm_size = modified_config.pop('pool_warm_size', None)
+        pool_size = modified_config.pop('pool_size', None)
+        if pool_size:
+            modified_config.setdefault('max_size', pool_size)
+        max_size = modified_config.get('max_size', 10)  # 10 is asyncpg's default
+        if pool_warm_size is not None:
+            modified_config.setdefault('min_size', min(pool_warm_size, max_size))
+        elif pool_size:
+            modified_config.setdefault('min_size', min(pool_size, 10))
         cls.pool = await asyncpg.create_pool(**modified_config)
 
     @classmethod
@@ -56,6 +56,14 @@ class RedisConnection(object):
     async def __aexit__(self, exc_type, exc, tb):
         await self.disconnect()
 
+    async def ping(self) -> None:
+        """
+        Pings the redis server.
+        """
+
+        self.logger.debug("Pinging Redis")
+        return await self.conn.ping()
+
     async def publish_json(self, channel:str, json:dict) -> None:
         """
         Publishes some JSON to a given redis channel.
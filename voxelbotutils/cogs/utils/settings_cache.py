@@ -0,0 +1,187 @@
+import collections.abc
+import copy
+import typing
+
+
+IMMUTABLE_SETTING_TYPES = (str, bytes, int, float, bool, type(None), tuple, frozenset)
+
+
+class SettingsCache(collections.abc.MutableMapping):
+    """
+    A cache for the rows of a settings table, keyed by ID.
+
+    Rather than holding a whole dict for every guild/user, each column is stored in its own
+    `{id: value}` dict, and anything that isn't stored falls back to the table defaults.
+    Indexing the cache gives a `SettingsView`, which can be used like the row dicts that used
+    to be cached; use `SettingsView.copy()` if you need an actual dict (eg to serialise it).
+    As with the old dicts, `values()` and `items()` give live views that write through to the
+    cache, whereas `pop()` and `popitem()` give dict snapshots of what was removed.
+    """
+
+    __slots__ = ('_get_defaults', 'columns', 'copied_defaults')
+
+    def __init__(self, get_defaults:typing.Callable[[], dict]):
+        """
+        Args:
+            get_defaults (typing.Callable[[], dict]): A function returning the default settings for the table.
+        """
+
+        self._get_defaults = get_defaults
+        self.columns: typing.Dict[str, dict] = {}
+        self.copied_defaults: typing.Dict[str, dict] = {}  # Mutable defaults that have been handed out, by column
+
+    @property
+    def defaults(self) -> dict:
+        return self._get_defaults()
+
+    def load(self, rows:typing.List[dict], key:str) -> None:
+        """
+        Fills the cache from a list of rows from the database.
+
+        Args:
+            rows (typing.List[dict]): The rows that you want to cache.
+            key (str): The column that the rows are keyed by.
+        """
+
+        if not rows:
+            return
+        for column in rows[0].keys():
+            self.columns.setdefault(column, {}).update({row[key]: row[column] for row in rows})
+
+    def get(self, item_id:int, default:typing.Any=None) -> typing.Optional['SettingsView']:
+        if item_id in self:
+            return self[item_id]
+        return default
+
+    def pop(self, item_id:int, *default) -> typing.Union[dict, typing.Any]:
+        """
+        Removes an ID from the cache, returning a snapshot of its settings as a dict.
+        """
+
+        if item_id in self:
+            settings = self[item_id].copy()
+            self._remove(item_id)
+            return settings
+        if default:
+            return default[0]
+        raise KeyError(item_id)
+
+    def popitem(self) -> typing.Tuple[int, dict]:
+        """
+        Removes an arbitrary ID from the cache, returning it and a snapshot of its settings as a dict.
+        """
+
+        try:
+            item_id = next(iter(self))
+        except StopIteration:
+            raise KeyError("popitem(): settings cache is empty")
+        return item_id, self.pop(item_id)
+
+    def setdefault(self, item_id:int, settings:dict=None) -> 'SettingsView':
+        """
+        Stores the given settings for an ID if it isn't already in the cache, returning its view.
+        """
+
+        if item_id not in self and settings is not None:
+            self[item_id] = settings
+        return self[item_id]
+
+    def _remove(self, item_id:int) -> bool:
+        found = False
+        for column in self.columns.values():
+            if item_id in column:
+                del column[item_id]
+                found = True
+        for column in self.copied_defaults.values():
+            column.pop(item_id, None)
+        return found
+
+    def __getitem__(self, item_id:int) -> 'SettingsView':
+        return SettingsView(self, item_id)
+
+    def __setitem__(self, item_id:int, settings:dict) -> None:
+        self._remove(item_id)
+        columns = self.columns
+        for column, value in settings.items():
+            columns.setdefault(column, {})[item_id] = value
+
+    def __delitem__(self, item_id:int) -> None:
+        if not self._remove(item_id):
+            raise KeyError(item_id)
+
+    def __contains__(self, item_id:int) -> bool:
+        return any(item_id in column for column in self.columns.values())
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(dict.fromkeys(i for column in self.columns.values() for i in column))
+
+    def __len__(self) -> int:
+        return len(set(i for column in self.columns.values() for i in column))
+
+    def clear(self) -> None:
+        self.columns.clear()
+        self.copied_defaults.clear()
+
+
+class SettingsView(collections.abc.MutableMapping):
+    """
+    The settings for a single ID in a `SettingsCache`, usable like a dict.
+
+    Values that haven't been set for this ID come from the cache's defaults. Mutable defaults
+    are copied for the ID the first time that they're accessed, so they can be changed in place
+    safely; this doesn't count as the ID being stored in the cache. Deleting a key resets it to
+    its default.
+    """
+
+    __slots__ = ('_cache', '_id')
+
+    def __init__(self, cache:SettingsCache, item_id:int):
+        self._cache = cache
+        self._id = item_id
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __copy__(self) -> dict:
+        return self.copy()
+
+    def __deepcopy__(self, memo:dict) -> dict:
+        return copy.deepcopy(self.copy(), memo)
+
+    def __getitem__(self, key:str) -> typing.Any:
+        for columns in (self._cache.columns, self._cache.copied_defaults):
+            column = columns.get(key)
+            if column is not None:
+                try:
+                    return column[self._id]
+                except KeyError:
+                    pass
+        value = self._cache.defaults[key]
+        if isinstance(value, IMMUTABLE_SETTING_TYPES):
+            return value
+        value = copy.deepcopy(value)
+        self._cache.copied_defaults.setdefault(key, {})[self._id] = value
+        return value
+
+    def __setitem__(self, key:str, value:typing.Any) -> None:
+        self._cache.columns.setdefault(key, {})[self._id] = value
+        self._cache.copied_defaults.get(key, {}).pop(self._id, None)
+
+    def __delitem__(self, key:str) -> None:
+        self._cache.copied_defaults.get(key, {}).pop(self._id, None)
+        try:
+            del self._cache.columns[key][self._id]
+        except KeyError:
+            if key not in self._cache.defaults:
+                raise KeyError(key)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        keys = dict.fromkeys(self._cache.defaults)
+        keys.update((column, None) for column, values in self._cache.columns.items() if self._id in values)
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
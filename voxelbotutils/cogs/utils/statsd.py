@@ -58,6 +58,14 @@ class StatsdConnection(object):
     def __init__(self, connection:aiodogstatsd.Client=None):
         self.conn = connection
 
+    @classmethod
+    def is_enabled(cls) -> bool:
+        """
+        Whether or not a real Statsd connection will be made, based on the config.
+        """
+
+        return bool((cls.config or {}).get("constant_tags", {}).get("service"))
+
     @classmethod
     async def get_connection(cls) -> 'StatsdConnection':
         """
@@ -68,7 +76,7 @@ class StatsdConnection(object):
         """
 
         config = cls.config.copy()
-        if not config.get("constant_tags", {}).get("service"):
+        if not cls.is_enabled():
             cls.logger.debug("Creating fake Statsd connection")
             conn = _FakeStatsdConnection()
         else:
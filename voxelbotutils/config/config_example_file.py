@@ -68,6 +68,8 @@ event_webhook_url = ""  # Some events will be posted via webhook to this url
     database = "database_name"
     host = "127.0.0.1"
     port = 5432
+    pool_size = 10  # The maximum amount of connections that the bot can have open at once
+    pool_warm_size = 5  # The amount of database and redis connections to open when the bot starts (the database pool's min_size)
 
 # This data is passed directly over to aioredis.connect()
 [redis]